@@ -4,27 +4,31 @@ import os
 import re
 import threading
 from datetime import datetime, timedelta, timezone
-from flask import Flask, request, abort
+import hmac
+from flask import Flask, Response, request, abort
 import logging
 
 # 官方 Line Bot SDK
 from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError, LineBotApiError
-from linebot.models import (
-    MessageEvent, TextMessage, TextSendMessage,
-    QuickReply, QuickReplyButton, PostbackAction, PostbackEvent,
-    ConfirmTemplate, TemplateSendMessage, PostbackTemplateAction
-)
+from linebot.exceptions import InvalidSignatureError
+from linebot.models import MessageEvent, TextMessage, TextSendMessage, PostbackEvent
 
 # 排程與日期工具
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.executors.pool import ThreadPoolExecutor
 from dateutil.parser import parse
 import pytz
+from sqlalchemy import update, func
 
 # 從我們自訂的 db 模組匯入
-from db import init_db, get_db, Event, safe_db_operation, cleanup_db
+from db import init_db, Event, cleanup_db, run_in_session, unit_of_work, get_pool_stats, shard_key_for
+from time_parser import parse_time_expression
+from message_templates import render_created_reply
+from profiles import ProfileCache, chat_target, collapse_mentions, MENTION_MARKER
+from profiling import profiler, install_signal_handler
+from dispatcher import ShardWorker, claim_reminder, dispatch_batch, DISPATCH_MODE, DISPATCH_POLL_INTERVAL
 
 # ---------------------------------
 # 初始化設定
@@ -39,6 +43,10 @@ logger = logging.getLogger(__name__)
 LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
 LINE_CHANNEL_SECRET = os.getenv('LINE_CHANNEL_SECRET')
 DATABASE_URL = os.getenv('DATABASE_URL')
+# 管理端點（/admin/*）的存取權杖，未設定時端點不開放
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+# 未確認的提醒每隔幾分鐘再提醒一次，未設定則不升級
+DEFAULT_ESCALATION_MINUTES = int(os.getenv('ESCALATION_MINUTES')) if os.getenv('ESCALATION_MINUTES') else None
 
 # 檢查必要環境變數
 if not LINE_CHANNEL_ACCESS_TOKEN:
@@ -57,7 +65,10 @@ UTC_TZ = pytz.UTC
 
 
 jobstores = {
-    'default': SQLAlchemyJobStore(url=DATABASE_URL)
+    # 提醒已改由到期掃描派送，這裡只剩先前建立、尚未執行的單一提醒任務
+    'default': SQLAlchemyJobStore(url=DATABASE_URL),
+    # 週期性的到期掃描不需要持久化，放在記憶體避免每次執行都寫入 jobstore
+    'memory': MemoryJobStore()
 }
 
 # 優化執行器設定
@@ -104,234 +115,155 @@ except Exception as e:
 # 初始化 LINE Bot API
 line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
 handler = WebhookHandler(LINE_CHANNEL_SECRET)
+profile_cache = ProfileCache(line_bot_api)
+
+# 排程模式下由排程器定期執行到期掃描，是唯一的派送路徑（含延後與升級提醒）；分片模式交給 dispatcher.py
+if DISPATCH_MODE != 'sharded':
+    due_scanner = ShardWorker(line_bot_api, shard_index=0, shard_count=1)
+    scheduler.add_job(
+        due_scanner.run_once,
+        'interval',
+        seconds=DISPATCH_POLL_INTERVAL,
+        id='dispatch_due_reminders',
+        jobstore='memory',
+        replace_existing=True
+    )
 
 # ---------------------------------
 # 資料庫輔助函式
 # ---------------------------------
-def add_event(creator_id, target_id, display_name, content, event_dt):
+def add_event(creator_id, target_id, display_name, content, event_dt, target_type='user'):
     """添加事件到資料庫"""
-    def _add_event():
-        db_gen = get_db()
-        db = next(db_gen)
-        try:
-            new_event = Event(
-                creator_user_id=creator_id,
-                target_user_id=target_id,
-                target_display_name=display_name,
-                event_content=content,
-                event_datetime=event_dt
-            )
-            db.add(new_event)
-            db.commit()
-            db.refresh(new_event)
-            return new_event.id
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error adding event: {e}")
-            raise
-        finally:
-            db.close()
+    def _add_event(db):
+        new_event = Event(
+            creator_user_id=creator_id,
+            target_type=target_type,
+            target_user_id=target_id,
+            target_display_name=display_name,
+            event_content=content,
+            event_datetime=event_dt,
+            shard_key=shard_key_for(target_id),
+            escalation_interval=DEFAULT_ESCALATION_MINUTES
+        )
+        db.add(new_event)
+        db.flush()
+        return new_event.id
 
     try:
-        return safe_db_operation(_add_event)
+        return run_in_session(_add_event)
     except Exception as e:
         logger.error(f"Failed to add event: {e}")
         return None
 
 def update_reminder_time(event_id, reminder_dt):
-    """更新提醒時間"""
-    def _update_reminder():
-        db_gen = get_db()
-        db = next(db_gen)
-        try:
-            event = db.query(Event).filter(Event.id == event_id).first()
-            if event:
-                event.reminder_time = reminder_dt
-                db.commit()
-                return True
-            return False
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error updating reminder time: {e}")
-            raise
-        finally:
-            db.close()
+    """重新設定提醒時間：以單一 UPDATE 重置送出、認領、升級與確認狀態，讓到期掃描重新送出"""
+    def _update_reminder(db):
+        result = db.execute(
+            update(Event)
+            .where(Event.id == event_id)
+            .values(
+                reminder_time=reminder_dt,
+                reminder_sent=0,
+                claimed_at=None,
+                escalation_count=0,
+                confirmed_at=None
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount > 0
 
     try:
-        return safe_db_operation(_update_reminder)
+        return run_in_session(_update_reminder)
     except Exception as e:
         logger.error(f"Failed to update reminder time: {e}")
         return False
 
 def get_event(event_id):
     """獲取事件資料"""
-    def _get_event():
-        db_gen = get_db()
-        db = next(db_gen)
-        try:
-            return db.query(Event).filter(Event.id == event_id).first()
-        finally:
-            db.close()
+    def _get_event(db):
+        return db.get(Event, event_id)
 
     try:
-        return safe_db_operation(_get_event)
+        return run_in_session(_get_event, readonly=True)
     except Exception as e:
         logger.error(f"Failed to get event: {e}")
         return None
 
-def mark_reminder_sent(event_id):
-    """標記提醒已發送"""
-    def _mark_sent():
-        db_gen = get_db()
-        db = next(db_gen)
-        try:
-            event = db.query(Event).filter(Event.id == event_id).first()
-            if event:
-                event.reminder_sent = 1
-                db.commit()
-                return True
-            return False
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error marking reminder as sent: {e}")
-            raise
-        finally:
-            db.close()
+def snooze_event(event_id, minutes):
+    """延後提醒：以單一 UPDATE 累計延後次數並設定下次提醒時間，回傳新的提醒時間"""
+    def _snooze(db):
+        return db.execute(
+            update(Event)
+            .where(Event.id == event_id, Event.confirmed_at.is_(None))
+            .values(
+                reminder_time=func.now() + func.make_interval(0, 0, 0, 0, 0, minutes),
+                reminder_sent=0,
+                snooze_count=Event.snooze_count + 1,
+                escalation_count=0,
+                claimed_at=None
+            )
+            .returning(Event.reminder_time)
+            .execution_options(synchronize_session=False)
+        ).scalar_one_or_none()
 
     try:
-        return safe_db_operation(_mark_sent)
+        return run_in_session(_snooze)
     except Exception as e:
-        logger.error(f"Failed to mark reminder as sent: {e}")
-        return False
+        logger.error(f"Failed to snooze reminder: {e}")
+        return None
 
-def reset_reminder_sent_status(event_id):
-    """重置提醒發送狀態"""
-    def _reset_status():
-        db_gen = get_db()
-        db = next(db_gen)
-        try:
-            event = db.query(Event).filter(Event.id == event_id).first()
-            if event:
-                event.reminder_sent = 0
-                db.commit()
-                return True
-            return False
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error resetting reminder status: {e}")
-            raise
-        finally:
-            db.close()
+def confirm_event(event_id):
+    """記錄使用者已確認，停止後續的升級提醒"""
+    def _confirm(db):
+        result = db.execute(
+            update(Event)
+            .where(Event.id == event_id)
+            .values(
+                confirmed_at=func.coalesce(Event.confirmed_at, func.now()),
+                reminder_sent=1,
+                claimed_at=None
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount > 0
 
     try:
-        return safe_db_operation(_reset_status)
+        return run_in_session(_confirm)
     except Exception as e:
-        logger.error(f"Failed to reset reminder status: {e}")
+        logger.error(f"Failed to confirm reminder: {e}")
         return False
 
 # ---------------------------------
 # 排程任務
 # ---------------------------------
 def send_reminder(event_id):
-    """發送提醒"""
+    """發送提醒
+
+    新的提醒只寫入 reminder_time、由到期掃描派送；保留此函式讓 jobstore 中既有的排程任務仍能執行。
+    """
     try:
-        with app.app_context():
+        with app.app_context(), unit_of_work():
             logger.info(f"Executing reminder for event_id: {event_id}")
             logger.info(f"Current UTC time: {datetime.now(UTC_TZ)}")
             logger.info(f"Current Taipei time: {datetime.now(TAIPEI_TZ)}")
             
-            event = get_event(event_id)
-            if not event or event.reminder_sent:
+            # 先認領，避免與到期掃描重複送出
+            claimed = claim_reminder(event_id)
+            if not claimed:
                 logger.warning(f"Skipping reminder for event_id {event_id}")
                 return
             
-            target_id = event.target_user_id
-            display_name = event.target_display_name
-            
-            # 確保事件時間是台北時區
-            event_dt = event.event_datetime
-            if event_dt.tzinfo is None:
-                event_dt = TAIPEI_TZ.localize(event_dt)
-            else:
-                event_dt = event_dt.astimezone(TAIPEI_TZ)
-            
-            event_content = event.event_content
-            
-            logger.info(f"Sending reminder to {target_id} for event at {event_dt}")
+            logger.info(f"Sending reminder to {claimed.target_user_id} for event at {claimed.event_datetime}")
             
-            # 建立確認模板
-            confirm_template = ConfirmTemplate(
-                text=f"⏰ 提醒！\n\n@{display_name}\n記得在 {event_dt.strftime('%Y/%m/%d %H:%M')} 要「{event_content}」喔！",
-                actions=[
-                    PostbackTemplateAction(
-                        label="確認收到",
-                        data=f"action=confirm_reminder&id={event_id}"
-                    ),
-                    PostbackTemplateAction(
-                        label="延後5分鐘",
-                        data=f"action=snooze_reminder&id={event_id}&minutes=5"
-                    )
-                ]
-            )
-            
-            template_message = TemplateSendMessage(
-                alt_text=f"提醒：{event_content}",
-                template=confirm_template
-            )
-            
-            # 發送訊息
-            line_bot_api.push_message(target_id, template_message)
-            mark_reminder_sent(event_id)
-            logger.info(f"Reminder sent successfully for event_id: {event_id}")
+            # 以預先組好的模板骨架產生確認訊息並發送；未確認且設有升級提醒時會排定下一次提醒
+            if dispatch_batch(line_bot_api, [claimed]):
+                logger.info(f"Reminder sent successfully for event_id: {event_id}")
             
     except Exception as e:
         logger.error(f"Error in send_reminder for event_id {event_id}: {e}")
         import traceback
         logger.error(traceback.format_exc())
 
-# ---------------------------------
-# 安全的排程器操作
-# ---------------------------------
-def safe_add_job(func, run_date, args, job_id):
-    """安全地添加任務到排程器"""
-    try:
-        with scheduler_lock:
-            if not scheduler.running:
-                safe_start_scheduler()
-            
-            # 移除現有任務
-            try:
-                scheduler.remove_job(job_id)
-            except:
-                pass
-            
-            # 確保使用UTC時間給排程器
-            if run_date.tzinfo is None:
-                run_date_utc = UTC_TZ.localize(run_date)
-            else:
-                run_date_utc = run_date.astimezone(UTC_TZ)
-            
-            # 添加新任務
-            scheduler.add_job(
-                func,
-                'date',
-                run_date=run_date_utc,
-                args=args,
-                id=job_id,
-                replace_existing=True
-            )
-            
-            # 日誌顯示兩種時間格式
-            taipei_time = run_date_utc.astimezone(TAIPEI_TZ)
-            logger.info(f"Successfully scheduled job: {job_id}")
-            logger.info(f"  UTC time: {run_date_utc}")
-            logger.info(f"  Taipei time: {taipei_time}")
-            
-            return True
-    except Exception as e:
-        logger.error(f"Error scheduling job {job_id}: {e}")
-        return False
-
 # ---------------------------------
 # 時間解析輔助函式
 # ---------------------------------
@@ -366,6 +298,28 @@ def parse_datetime(datetime_str):
         logger.error(f"Error parsing datetime '{datetime_str}': {e}")
         return None
 
+# ---------------------------------
+# 提醒指令格式
+# ---------------------------------
+REMINDER_COMMAND_PATTERN = re.compile(r'^提醒\s+(\S+)\s+(.+)$')
+REMINDER_PATTERN = re.compile(r'^提醒\s+(\S+)\s+([\d/\-\s:]+)\s*(\d{1,2}:\d{2})?\s+(.+)$')
+
+HELP_TEXT = """請使用以下格式：
+提醒 我 2025/07/15 17:20 做某事
+提醒 我 7/15 17:20 做某事
+提醒 我 明天 17:20 做某事
+提醒 我 下週一 9點 做某事
+提醒 我 3小時後 做某事
+提醒 @成員 明天 9點 做某事（群組中）
+
+支援的時間格式：
+- 年/月/日 時:分
+- 月/日 時:分
+- 今天/明天/後天 時:分
+- 今晚八點、明早7點
+- 週一~週日、下週X 上午/下午/晚上 X點(半)
+- N分鐘後、N小時後、N天後"""
+
 # ---------------------------------
 # Webhook 路由
 # ---------------------------------
@@ -379,7 +333,9 @@ def callback():
             abort(400)
             
         body = request.get_data(as_text=True)
-        handler.handle(body, signature)
+        # 同一個 webhook 內的所有事件共用一個資料庫 session
+        with unit_of_work():
+            handler.handle(body, signature)
         return 'OK'
         
     except InvalidSignatureError:
@@ -399,74 +355,66 @@ def handle_message(event):
         text = event.message.text.strip()
         creator_user_id = event.source.user_id
         
-        # 提供使用說明
-        if text.startswith('提醒') and not re.match(r'^提醒\s+(\S+)\s+([\d/\-\s:]+|明天|後天)\s*(\d{1,2}:\d{2})?\s+(.+)$', text):
-            help_text = """請使用以下格式：
-提醒 我 2025/07/15 17:20 做某事
-提醒 我 7/15 17:20 做某事
-提醒 我 明天 17:20 做某事
-
-支援的時間格式：
-- 年/月/日 時:分
-- 月/日 時:分
-- 明天 時:分
-- 後天 時:分"""
-            
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text=help_text)
-            )
+        if not text.startswith('提醒'):
             return
 
-        # 解析提醒指令
-        match = re.match(r'^提醒\s+(\S+)\s+([\d/\-\s:]+|明天|後天)\s*(\d{1,2}:\d{2})?\s+(.+)$', text)
-        if not match:
-            return
+        # 群組 / 多人聊天室的提醒只建立一筆事件，推播到整個聊天室
+        target_type, target_user_id = chat_target(event.source)
+        text, mentioned = collapse_mentions(event.message, text)
+
+        # 先嘗試中文時間描述（下週一 9點、3小時後、今晚八點...），再退回數字日期格式
+        event_dt = None
+        command = REMINDER_COMMAND_PATTERN.match(text)
+        resolved = parse_time_expression(command.group(2)) if command else None
+        if resolved and resolved[1].strip():
+            who_to_remind_text = command.group(1)
+            event_dt, content = resolved[0], resolved[1].strip()
+        else:
+            match = REMINDER_PATTERN.match(text)
+            if not match:
+                # 提供使用說明
+                line_bot_api.reply_message(
+                    event.reply_token,
+                    TextSendMessage(text=HELP_TEXT)
+                )
+                return
 
-        who_to_remind_text = match.group(1)
-        date_str = match.group(2)
-        time_str = match.group(3)
-        content = match.group(4).strip()
-
-        # 處理特殊日期
-        if date_str == '明天':
-            tomorrow = datetime.now(TAIPEI_TZ) + timedelta(days=1)
-            date_str = tomorrow.strftime('%Y/%m/%d')
-        elif date_str == '後天':
-            day_after_tomorrow = datetime.now(TAIPEI_TZ) + timedelta(days=2)
-            date_str = day_after_tomorrow.strftime('%Y/%m/%d')
-        
-        # 組合日期和時間
-        datetime_str = f"{date_str} {time_str}" if time_str else date_str
+            who_to_remind_text = match.group(1)
+            date_str = match.group(2).strip()
+            time_str = match.group(3)
+            content = match.group(4).strip()
+
+            # 組合日期和時間
+            datetime_str = f"{date_str} {time_str}" if time_str else date_str
 
         # 判斷提醒對象
-        if who_to_remind_text == '我':
-            try:
-                profile = line_bot_api.get_profile(creator_user_id)
-                target_user_id = creator_user_id
-                target_display_name = profile.display_name
-            except LineBotApiError:
-                target_user_id = creator_user_id
-                target_display_name = "您"
+        if who_to_remind_text == MENTION_MARKER:
+            # 被提及的成員名稱一次查詢並快取，查不到時沿用訊息中的名稱
+            names = profile_cache.get_display_names(
+                target_type, target_user_id, [user_id for user_id, _ in mentioned if user_id]
+            )
+            target_display_name = '、'.join(names.get(user_id, name) for user_id, name in mentioned)
+        elif who_to_remind_text == '我':
+            target_display_name = profile_cache.get_display_name(target_type, target_user_id, creator_user_id) or "您"
         else:
-            target_user_id = creator_user_id
             target_display_name = who_to_remind_text
 
-        # 解析時間
-        naive_dt = parse_datetime(datetime_str)
-        if not naive_dt:
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="❌ 時間格式有誤，請檢查後重新輸入。")
-            )
-            return
-        
-        # 設定時區 - 強制轉換為台北時區
-        if naive_dt.tzinfo is None:
-            event_dt = TAIPEI_TZ.localize(naive_dt)
-        else:
-            event_dt = naive_dt.astimezone(TAIPEI_TZ)
-        
+        if event_dt is None:
+            # 解析時間
+            naive_dt = parse_datetime(datetime_str)
+            if not naive_dt:
+                line_bot_api.reply_message(
+                    event.reply_token,
+                    TextSendMessage(text="❌ 時間格式有誤，請檢查後重新輸入。")
+                )
+                return
+
+            # 設定時區 - 強制轉換為台北時區
+            if naive_dt.tzinfo is None:
+                event_dt = TAIPEI_TZ.localize(naive_dt)
+            else:
+                event_dt = naive_dt.astimezone(TAIPEI_TZ)
+
         # 檢查時間是否在過去
         current_time = datetime.now(TAIPEI_TZ)
         logger.info(f"Event time: {event_dt}, Current time: {current_time}")
@@ -479,7 +427,7 @@ def handle_message(event):
             return
 
         # 儲存事件
-        event_id = add_event(creator_user_id, target_user_id, target_display_name, content, event_dt)
+        event_id = add_event(creator_user_id, target_user_id, target_display_name, content, event_dt, target_type)
         
         if not event_id:
             line_bot_api.reply_message(
@@ -488,19 +436,12 @@ def handle_message(event):
             )
             return
         
-        # 建立快捷回覆
-        quick_reply_buttons = QuickReply(items=[
-            QuickReplyButton(action=PostbackAction(label="10分鐘前", data=f"action=set_reminder&id={event_id}&type=minute&val=10")),
-            QuickReplyButton(action=PostbackAction(label="30分鐘前", data=f"action=set_reminder&id={event_id}&type=minute&val=30")),
-            QuickReplyButton(action=PostbackAction(label="1天前", data=f"action=set_reminder&id={event_id}&type=day&val=1")),
-            QuickReplyButton(action=PostbackAction(label="不提醒", data=f"action=set_reminder&id={event_id}&type=none")),
-        ])
-
         reply_text = f"✅ 已記錄：{target_display_name} {event_dt.strftime('%Y/%m/%d %H:%M')} {content}\n\n希望什麼時候提醒您呢？"
         
+        # 快捷回覆按鈕使用預先組好的骨架
         line_bot_api.reply_message(
             event.reply_token,
-            TextSendMessage(text=reply_text, quick_reply=quick_reply_buttons)
+            render_created_reply(event_id, reply_text)
         )
         
     except Exception as e:
@@ -579,18 +520,8 @@ def handle_postback(event):
                     logger.info(f"  Event time (Taipei): {event_dt}")
                     logger.info(f"  Reminder time (Taipei): {reminder_dt}")
                     
-                    # 安全地添加任務 - 會自動轉換為UTC
-                    success = safe_add_job(
-                        send_reminder,
-                        reminder_dt,  # 傳入台北時間，函式內會轉換為UTC
-                        [event_id],
-                        f'reminder_{event_id}'
-                    )
-                    
-                    if success:
-                        reply_msg_text = f"✅ 設定完成！將於 {reminder_dt.strftime('%Y/%m/%d %H:%M')} 提醒您。"
-                    else:
-                        reply_msg_text = "❌ 設定提醒時發生錯誤。"
+                    # 只需寫入 reminder_time（見下方），由到期掃描派送，不另建排程任務
+                    reply_msg_text = f"✅ 設定完成！將於 {reminder_dt.strftime('%Y/%m/%d %H:%M')} 提醒您。"
                 else:
                     reply_msg_text = "❌ 設定提醒時發生未知的錯誤。"
             
@@ -602,34 +533,29 @@ def handle_postback(event):
         
         elif action == 'confirm_reminder':
             event_id = int(data.get('id'))
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="✅ 提醒已確認收到！")
-            )
+            if confirm_event(event_id):
+                line_bot_api.reply_message(
+                    event.reply_token,
+                    TextSendMessage(text="✅ 提醒已確認收到！")
+                )
+            else:
+                line_bot_api.reply_message(
+                    event.reply_token,
+                    TextSendMessage(text="❌ 找不到該提醒事件。")
+                )
             
         elif action == 'snooze_reminder':
             event_id = int(data.get('id'))
             minutes = int(data.get('minutes', 5))
             
-            if not reset_reminder_sent_status(event_id):
-                logger.error(f"Failed to reset reminder status for snooze, event_id: {event_id}")
-            
-            # 重新排程提醒
-                snooze_time = datetime.now(TAIPEI_TZ) + timedelta(minutes=minutes)
-            
-                success = safe_add_job(
-                    send_reminder,
-                    snooze_time,
-                    [event_id],
-                    f'reminder_{event_id}'
-                )
-            
-            if success:
+            # 延後只更新事件本身，由到期掃描送出，不另外建立排程任務
+            if snooze_event(event_id, minutes):
                 line_bot_api.reply_message(
                     event.reply_token,
                     TextSendMessage(text=f"⏰ 好的，{minutes}分鐘後再次提醒您！")
                 )
             else:
+                logger.error(f"Failed to snooze reminder, event_id: {event_id}")
                 line_bot_api.reply_message(
                     event.reply_token,
                     TextSendMessage(text="❌ 延後提醒設定失敗。")
@@ -657,6 +583,7 @@ def health_check():
         "status": "healthy", 
         "scheduler_running": scheduler.running,
         "scheduled_jobs": len(scheduler.get_jobs()) if scheduler.running else 0,
+        "db_pool": get_pool_stats(),
         "current_utc_time": datetime.now(UTC_TZ).isoformat(),
         "current_taipei_time": datetime.now(TAIPEI_TZ).isoformat()
     }
@@ -666,6 +593,46 @@ def index():
     """根路由"""
     return "LINE Bot Reminder Service is running!"
 
+# ---------------------------------
+# 效能分析端點
+# ---------------------------------
+# 只統計落在這些 handler 內的樣本；註冊不會包裝函式，未啟用時沒有額外開銷
+for _profiled_handler in (callback, handle_message, handle_postback, send_reminder, dispatch_batch):
+    profiler.register(_profiled_handler)
+install_signal_handler()
+
+def require_admin():
+    """檢查管理權杖，不符時回應 404 以免暴露端點"""
+    token = request.headers.get('X-Admin-Token', '')
+    if not ADMIN_TOKEN or not hmac.compare_digest(token, ADMIN_TOKEN):
+        abort(404)
+
+@app.route("/admin/profile", methods=['POST'])
+def start_profile():
+    """開始取樣：?seconds=N 分析 N 秒，或 ?invocations=N 分析到約 N 次 handler 呼叫被取樣到為止
+
+    呼叫次數由樣本推算，比取樣間隔短的呼叫可能沒被計入，實際涵蓋的呼叫會多於 N。
+    """
+    require_admin()
+    seconds = request.args.get('seconds', type=int)
+    invocations = request.args.get('invocations', type=int)
+    if not seconds and not invocations:
+        seconds = 30
+    if not profiler.start(seconds=seconds, invocations=invocations):
+        return {"error": "profiling already running", **profiler.summary()}, 409
+    logger.info(f"Profiling started: seconds={seconds}, invocations={invocations}")
+    return profiler.summary(), 202
+
+@app.route("/admin/profile", methods=['GET'])
+def get_profile():
+    """取得最近一次的分析結果（collapsed stack 格式）；仍在取樣時回傳進度"""
+    require_admin()
+    if profiler.running:
+        return profiler.summary(), 202
+    if profiler.started_at is None:
+        return {"error": "no profile collected"}, 404
+    return Response(profiler.collapsed(), mimetype='text/plain')
+
 # ---------------------------------
 # 清理函式
 # ---------------------------------
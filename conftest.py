@@ -0,0 +1,7 @@
+# 讓 tests/ 可以直接匯入專案根目錄的模組
+import os
+
+# db 模組匯入時就會建立引擎，必須在任何測試匯入 db 之前決定連線目標：
+# 設定 TEST_DATABASE_URL 時使用該資料庫，否則使用不會實際連線的 SQLite 記憶體資料庫
+os.environ['DATABASE_URL'] = os.getenv('TEST_DATABASE_URL') or 'sqlite://'
+os.environ.pop('DATABASE_REPLICA_URL', None)
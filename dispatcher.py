@@ -0,0 +1,330 @@
+# dispatcher.py
+# 分片提醒派送：依 target_user_id 的雜湊把到期提醒分給多個 worker 程序
+#
+# 執行方式：
+#   python dispatcher.py                 單一 worker，與其他節點上的 worker 以心跳自動分配 shard
+#   python dispatcher.py --local 4       在本機啟動 4 個 worker 程序，固定分配 shard
+#
+# 只在 DISPATCH_MODE=sharded 時派送；排程模式由 web 程序的排程器負責，這裡只閒置等待結束訊號
+# （直接結束會被平台不斷重啟），不需要時可把 dispatch 程序數調為 0。
+# 吞吐量與「每則只送一次、同一使用者依序」的驗證見 tests/test_dispatcher.py。
+
+import os
+import sys
+import time
+import uuid
+import socket
+import signal
+import logging
+import threading
+import multiprocessing
+from datetime import datetime, timedelta
+
+import pytz
+from sqlalchemy import select, update, delete, or_, and_, case, func
+
+from db import Event, DispatchWorker, engine, init_db, shard_key_for, unit_of_work, run_in_session
+from message_templates import render_reminder
+from profiling import profiler, install_signal_handler
+
+logger = logging.getLogger(__name__)
+
+UTC_TZ = pytz.UTC
+
+# scheduler：由 web 程序的排程器派送；sharded：由本模組的 worker 依 target_user_id 分片掃描派送
+DISPATCH_MODE = os.getenv('DISPATCH_MODE', 'scheduler')
+DISPATCH_POLL_INTERVAL = float(os.getenv('DISPATCH_POLL_INTERVAL', 5))
+DISPATCH_BATCH_SIZE = int(os.getenv('DISPATCH_BATCH_SIZE', 200))
+# 認領後多久沒完成視為失敗，交給下一次掃描重試
+DISPATCH_LEASE_SECONDS = int(os.getenv('DISPATCH_LEASE_SECONDS', 60))
+# 超過這個時間仍未送出的提醒不再補送（相當於排程器的 misfire_grace_time）
+DISPATCH_MISFIRE_GRACE = int(os.getenv('DISPATCH_MISFIRE_GRACE', 600))
+# 心跳逾時即視為離開，剩下的 worker 重新分配 shard
+WORKER_HEARTBEAT_TTL = int(os.getenv('WORKER_HEARTBEAT_TTL', 30))
+# 未確認的提醒最多再提醒幾次
+MAX_ESCALATIONS = int(os.getenv('MAX_ESCALATIONS', 3))
+
+
+def shard_of(user_id, shard_count):
+    """使用者所屬的 shard 編號"""
+    return shard_key_for(user_id) % shard_count
+
+
+# ---------------------------------
+# 成員管理
+# ---------------------------------
+def heartbeat(worker_id):
+    """更新心跳並回傳 (本 worker 的 shard 編號, 存活 worker 數)"""
+    def _heartbeat(db):
+        now = datetime.now(UTC_TZ)
+        worker = db.get(DispatchWorker, worker_id)
+        if worker:
+            worker.heartbeat_at = now
+        else:
+            db.add(DispatchWorker(worker_id=worker_id, heartbeat_at=now))
+        db.flush()
+        # 清掉已離開的 worker，順序固定以便所有 worker 得到一致的分配
+        db.execute(delete(DispatchWorker).where(
+            DispatchWorker.heartbeat_at < now - timedelta(seconds=WORKER_HEARTBEAT_TTL)
+        ))
+        members = db.scalars(select(DispatchWorker.worker_id).order_by(DispatchWorker.worker_id)).all()
+        return members.index(worker_id), len(members)
+
+    return run_in_session(_heartbeat)
+
+
+def leave(worker_id):
+    """離開時移除自己，讓其他 worker 立即接手"""
+    def _leave(db):
+        db.execute(delete(DispatchWorker).where(DispatchWorker.worker_id == worker_id))
+
+    try:
+        run_in_session(_leave)
+    except Exception as e:
+        logger.error(f"Failed to unregister worker {worker_id}: {e}")
+
+
+# ---------------------------------
+# 認領與派送
+# ---------------------------------
+def _claim(db, conditions, limit):
+    now = datetime.now(UTC_TZ)
+    claimable_ids = (
+        select(Event.id)
+        .where(
+            Event.reminder_sent == 0,
+            or_(Event.claimed_at.is_(None), Event.claimed_at < now - timedelta(seconds=DISPATCH_LEASE_SECONDS)),
+            *conditions
+        )
+        .order_by(Event.reminder_time, Event.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    rows = db.execute(
+        update(Event)
+        .where(Event.id.in_(claimable_ids.scalar_subquery()))
+        .values(claimed_at=now)
+        .returning(
+            Event.id, Event.target_user_id, Event.target_display_name,
+            Event.event_content, Event.event_datetime, Event.reminder_time, Event.claimed_at
+        )
+        .execution_options(synchronize_session=False)
+    ).all()
+    # RETURNING 不保證順序，依提醒時間排好以維持同一使用者的先後順序
+    return sorted(rows, key=lambda row: (row.reminder_time, row.id))
+
+
+def claim_due_reminders(shard_index, shard_count, limit=DISPATCH_BATCH_SIZE):
+    """認領本 shard 的到期提醒；SKIP LOCKED 讓重新分配期間的重疊 worker 不會重複認領"""
+    def _claim_due(db):
+        now = datetime.now(UTC_TZ)
+        return _claim(db, [
+            Event.reminder_time <= now,
+            Event.reminder_time >= now - timedelta(seconds=DISPATCH_MISFIRE_GRACE),
+            Event.shard_key.op('%')(shard_count) == shard_index,
+        ], limit)
+
+    return run_in_session(_claim_due)
+
+
+def claim_reminder(event_id):
+    """認領單一提醒（排程任務觸發時使用）
+
+    已送出、已被到期掃描認領，或提醒時間已改到未來（舊的排程任務）時回傳 None。
+    """
+    def _claim_one(db):
+        return _claim(db, [Event.id == event_id, Event.reminder_time <= datetime.now(UTC_TZ)], 1)
+
+    rows = run_in_session(_claim_one)
+    return rows[0] if rows else None
+
+
+def mark_dispatched(event_ids, claimed_at):
+    """一次標記整批已送出的提醒
+
+    設有升級提醒且尚未確認的事件不標記為已送出，而是在同一個 UPDATE 中
+    排定下一次提醒時間，交給到期掃描再次送出。
+    只更新 claimed_at 仍是這次認領時間的事件：送出期間被延後或確認的事件已清掉租約，保留它們的新狀態。
+    """
+    if not event_ids:
+        return
+
+    escalate = and_(
+        Event.escalation_interval.isnot(None),
+        Event.confirmed_at.is_(None),
+        Event.escalation_count < MAX_ESCALATIONS,
+    )
+
+    def _mark(db):
+        db.execute(
+            update(Event)
+            .where(Event.id.in_(event_ids), Event.claimed_at == claimed_at)
+            .values(
+                reminder_sent=case((escalate, 0), else_=1),
+                reminder_time=case(
+                    (escalate, func.now() + func.make_interval(0, 0, 0, 0, 0, Event.escalation_interval)),
+                    else_=Event.reminder_time
+                ),
+                escalation_count=case((escalate, Event.escalation_count + 1), else_=Event.escalation_count),
+                claimed_at=None
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    run_in_session(_mark)
+
+
+def release_claims(event_ids, claimed_at):
+    """釋放尚未送出的提醒的租約，讓下一次掃描依提醒時間重新認領"""
+    if not event_ids:
+        return
+
+    def _release(db):
+        db.execute(
+            update(Event)
+            .where(Event.id.in_(event_ids), Event.claimed_at == claimed_at)
+            .values(claimed_at=None)
+            .execution_options(synchronize_session=False)
+        )
+
+    run_in_session(_release)
+
+
+def dispatch_batch(line_bot_api, rows):
+    """依序送出一批提醒，回傳成功送出的數量
+
+    某位使用者的提醒送出失敗時，跳過他在這批中後面的提醒，並連同失敗的那則一起釋放租約，
+    下一次掃描會從失敗的那則開始依序重試，不會讓較晚的提醒先送出。
+    """
+    sent_ids = {}
+    released_ids = {}
+    failed_users = set()
+    for row in rows:
+        if row.target_user_id in failed_users:
+            released_ids.setdefault(row.claimed_at, []).append(row.id)
+            continue
+        try:
+            message = render_reminder(row.id, row.target_display_name, row.event_datetime, row.event_content)
+            line_bot_api.push_message(row.target_user_id, message)
+            sent_ids.setdefault(row.claimed_at, []).append(row.id)
+        except Exception as e:
+            logger.error(f"Error dispatching reminder for event_id {row.id}: {e}")
+            failed_users.add(row.target_user_id)
+            released_ids.setdefault(row.claimed_at, []).append(row.id)
+    # 同一次認領的事件共用同一個 claimed_at，通常只有一組
+    for claimed_at, event_ids in sent_ids.items():
+        mark_dispatched(event_ids, claimed_at)
+    for claimed_at, event_ids in released_ids.items():
+        release_claims(event_ids, claimed_at)
+    return sum(len(event_ids) for event_ids in sent_ids.values())
+
+
+# ---------------------------------
+# Worker 主迴圈
+# ---------------------------------
+class ShardWorker:
+    """派送 worker；指定 shard_index/shard_count 時固定分配，否則依成員表動態分配"""
+
+    def __init__(self, line_bot_api, shard_index=None, shard_count=None, worker_id=None):
+        self.line_bot_api = line_bot_api
+        self.static_shard = (shard_index, shard_count) if shard_count else None
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.running = False
+        self.assignment = None
+
+    def current_shard(self):
+        if self.static_shard:
+            return self.static_shard
+        assignment = heartbeat(self.worker_id)
+        if assignment != self.assignment:
+            logger.info(f"Worker {self.worker_id} rebalanced: shard {assignment[0]} of {assignment[1]}")
+            self.assignment = assignment
+        return assignment
+
+    def run_once(self):
+        shard_index, shard_count = self.current_shard()
+        # 認領與標記已送出共用同一個 session
+        with unit_of_work():
+            rows = claim_due_reminders(shard_index, shard_count)
+            if not rows:
+                return 0
+            return dispatch_batch(self.line_bot_api, rows)
+
+    def run(self):
+        self.running = True
+        try:
+            while self.running:
+                try:
+                    sent = self.run_once()
+                except Exception as e:
+                    logger.error(f"Dispatch loop error in worker {self.worker_id}: {e}")
+                    sent = 0
+                # 還有積壓時立即再掃一次
+                if sent < DISPATCH_BATCH_SIZE:
+                    time.sleep(DISPATCH_POLL_INTERVAL)
+        finally:
+            if not self.static_shard:
+                leave(self.worker_id)
+
+    def stop(self, *_):
+        self.running = False
+
+
+def _create_line_bot_api():
+    from linebot import LineBotApi
+    token = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
+    if not token:
+        raise ValueError("LINE_CHANNEL_ACCESS_TOKEN is not set")
+    return LineBotApi(token)
+
+
+def _idle_until_stopped():
+    """非分片模式下閒置到收到 SIGTERM/SIGINT；直接結束的程序會被平台反覆重啟"""
+    logger.warning(
+        f"DISPATCH_MODE is {DISPATCH_MODE!r}; reminders are sent by the web process. "
+        "Dispatcher idling (set DISPATCH_MODE=sharded, or scale the dispatch process to 0)"
+    )
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    while not stopped.wait(60):
+        pass
+
+
+def _run_worker(shard_index=None, shard_count=None):
+    logging.basicConfig(level=logging.INFO)
+    # kill -USR2 <pid> 分析 30 秒內的派送，結果寫入 PROFILE_DIR
+    profiler.register(dispatch_batch)
+    install_signal_handler()
+    worker = ShardWorker(_create_line_bot_api(), shard_index, shard_count)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    logger.info(f"Dispatch worker {worker.worker_id} started")
+    worker.run()
+
+
+def run_local_shards(shard_count):
+    """在本機以多個程序跑固定分配的 shard"""
+    # 子程序不能沿用父程序連線池裡的連線
+    engine.dispose()
+    processes = [
+        multiprocessing.Process(target=_run_worker, args=(index, shard_count), name=f"dispatch-{index}")
+        for index in range(shard_count)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if DISPATCH_MODE != 'sharded':
+        _idle_until_stopped()
+        sys.exit(0)
+    # dispatcher 可能比 web 程序先啟動，先補齊資料表與欄位
+    init_db()
+    if len(sys.argv) > 2 and sys.argv[1] == '--local':
+        run_local_shards(int(sys.argv[2]))
+    else:
+        _run_worker()
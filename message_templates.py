@@ -0,0 +1,150 @@
+# message_templates.py
+# 預先組好的訊息骨架：靜態部分只建立一次，每次只替換事件相關欄位
+
+import time
+import tracemalloc
+from datetime import datetime
+from functools import lru_cache
+import pytz
+
+from linebot.models import (
+    QuickReply, QuickReplyButton, PostbackAction,
+    ConfirmTemplate, TemplateSendMessage, PostbackTemplateAction
+)
+
+TAIPEI_TZ = pytz.timezone('Asia/Taipei')
+
+
+class RenderedMessage:
+    """已組好的訊息 JSON；LineBotApi 只會呼叫 as_json_dict()，可直接傳入 push/reply"""
+
+    __slots__ = ('payload',)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def as_json_dict(self):
+        return self.payload
+
+
+# ---------------------------------
+# 骨架（以 SDK 物件建立一次，確保欄位格式正確）
+# ---------------------------------
+REMINDER_ACTIONS = [
+    ("確認收到", "action=confirm_reminder&id={event_id}"),
+    ("延後5分鐘", "action=snooze_reminder&id={event_id}&minutes=5"),
+]
+
+QUICK_REPLY_ACTIONS = [
+    ("10分鐘前", "action=set_reminder&id={event_id}&type=minute&val=10"),
+    ("30分鐘前", "action=set_reminder&id={event_id}&type=minute&val=30"),
+    ("1天前", "action=set_reminder&id={event_id}&type=day&val=1"),
+    ("不提醒", "action=set_reminder&id={event_id}&type=none"),
+]
+
+_REMINDER_SKELETON = TemplateSendMessage(
+    alt_text="",
+    template=ConfirmTemplate(
+        text="",
+        actions=[PostbackTemplateAction(label=label, data="") for label, _ in REMINDER_ACTIONS]
+    )
+).as_json_dict()
+_REMINDER_ACTION_SKELETONS = list(zip(
+    _REMINDER_SKELETON['template']['actions'],
+    [data for _, data in REMINDER_ACTIONS]
+))
+
+_QUICK_REPLY_SKELETON = QuickReply(items=[
+    QuickReplyButton(action=PostbackAction(label=label, data=""))
+    for label, _ in QUICK_REPLY_ACTIONS
+]).as_json_dict()
+_QUICK_REPLY_ITEM_SKELETONS = list(zip(
+    _QUICK_REPLY_SKELETON['items'],
+    [data for _, data in QUICK_REPLY_ACTIONS]
+))
+
+
+@lru_cache(maxsize=1024)
+def format_event_time(event_dt):
+    """將事件時間轉為台北時區字串；同一時間點的大量提醒只需轉換一次"""
+    if event_dt.tzinfo is None:
+        event_dt = TAIPEI_TZ.localize(event_dt)
+    else:
+        event_dt = event_dt.astimezone(TAIPEI_TZ)
+    return event_dt.strftime('%Y/%m/%d %H:%M')
+
+
+def render_reminder(event_id, display_name, event_dt, content):
+    """組出提醒用的確認模板訊息"""
+    template = _REMINDER_SKELETON['template']
+    return RenderedMessage({
+        **_REMINDER_SKELETON,
+        'altText': f"提醒：{content}",
+        'template': {
+            **template,
+            'text': f"⏰ 提醒！\n\n@{display_name}\n記得在 {format_event_time(event_dt)} 要「{content}」喔！",
+            'actions': [
+                {**action, 'data': data.format(event_id=event_id)}
+                for action, data in _REMINDER_ACTION_SKELETONS
+            ],
+        },
+    })
+
+
+def render_created_reply(event_id, text):
+    """組出建立事件後附帶「何時提醒」快捷按鈕的文字訊息"""
+    return RenderedMessage({
+        'type': 'text',
+        'text': text,
+        'quickReply': {
+            **_QUICK_REPLY_SKELETON,
+            'items': [
+                {**item, 'action': {**item['action'], 'data': data.format(event_id=event_id)}}
+                for item, data in _QUICK_REPLY_ITEM_SKELETONS
+            ],
+        },
+    })
+
+
+# ---------------------------------
+# 效能測試：python message_templates.py
+# ---------------------------------
+def _build_with_sdk(event_id, display_name, event_dt, content):
+    local_dt = event_dt.astimezone(TAIPEI_TZ)
+    return TemplateSendMessage(
+        alt_text=f"提醒：{content}",
+        template=ConfirmTemplate(
+            text=f"⏰ 提醒！\n\n@{display_name}\n記得在 {local_dt.strftime('%Y/%m/%d %H:%M')} 要「{content}」喔！",
+            actions=[
+                PostbackTemplateAction(label="確認收到", data=f"action=confirm_reminder&id={event_id}"),
+                PostbackTemplateAction(label="延後5分鐘", data=f"action=snooze_reminder&id={event_id}&minutes=5"),
+            ]
+        )
+    ).as_json_dict()
+
+
+def _measure(build, iterations):
+    event_dt = TAIPEI_TZ.localize(datetime(2025, 7, 15, 8, 0))
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    kept = [build(i, "小明", event_dt, "吃藥") for i in range(200)]
+    snapshot_after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del kept
+    allocations = sum(stat.count_diff for stat in snapshot_after.compare_to(snapshot_before, 'filename') if stat.count_diff > 0)
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        build(i, "小明", event_dt, "吃藥")
+    elapsed = time.perf_counter() - start
+    return elapsed / iterations * 1e6, allocations / 200
+
+
+if __name__ == "__main__":
+    iterations = 50000
+    for name, build in [
+        ("sdk objects", _build_with_sdk),
+        ("skeleton", lambda *args: render_reminder(*args).as_json_dict()),
+    ]:
+        per_call_us, allocations = _measure(build, iterations)
+        print(f"{name:12} {per_call_us:8.2f} µs/reminder  {allocations:.1f} memory blocks/reminder")
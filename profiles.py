@@ -0,0 +1,139 @@
+# profiles.py
+# 成員顯示名稱查詢：以 (聊天室, 使用者) 為鍵快取，未命中的名稱一次並行查詢
+
+import os
+import re
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from linebot.exceptions import LineBotApiError
+
+logger = logging.getLogger(__name__)
+
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', 3600))
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 5000))
+PROFILE_LOOKUP_WORKERS = 4
+
+# 提及的成員在指令中以單一標記代替
+MENTION_MARKER = '@@'
+_COMMAND_PREFIX = re.compile(r'^提醒\s+')
+
+
+def chat_target(source):
+    """回傳 (target_type, 推播對象 id)：群組與多人聊天室推播到整個聊天室，其餘推播給使用者本人"""
+    if source.type == 'group':
+        return 'group', source.group_id
+    if source.type == 'room':
+        return 'room', source.room_id
+    return 'user', source.user_id
+
+
+def _utf16_positions(text):
+    """{UTF-16 位置: 字串位置}；落在代理對中間的位置不在其中"""
+    positions = {}
+    offset = 0
+    for index, ch in enumerate(text):
+        positions[offset] = index
+        offset += 2 if ord(ch) > 0xFFFF else 1
+    positions[offset] = len(text)
+    return positions
+
+
+def collapse_mentions(message, text):
+    """把緊接在「提醒」後面的一串 @成員 換成 MENTION_MARKER
+
+    text 是去掉前後空白的 message.text。回傳 (處理後的文字, [(user_id, 訊息中的名稱)])；
+    提醒對象不是 @成員 時原樣回傳，事件內容中的提及一律保留。
+    """
+    mention = getattr(message, 'mention', None)
+    prefix = _COMMAND_PREFIX.match(text)
+    if not mention or not mention.mentionees or not prefix:
+        return text, []
+
+    # mentionee.index / length 是以原始訊息計算的 UTF-16 位置，先換算成字串位置，
+    # 名稱中含 emoji 等 BMP 以外的字元時兩者不同
+    positions = _utf16_positions(message.text)
+    offset = len(message.text) - len(message.text.lstrip())
+    cursor = prefix.end()
+    mentioned = []
+    for mentionee in sorted(mention.mentionees, key=lambda m: m.index):
+        start = positions.get(mentionee.index)
+        end = positions.get(mentionee.index + mentionee.length)
+        if start is None or end is None:
+            break
+        start -= offset
+        end -= offset
+        # 提及之間只能隔著空白，遇到其他文字代表提醒對象已結束
+        if start < cursor or text[cursor:start].strip() or (not mentioned and start != cursor):
+            break
+        mentioned.append((mentionee.user_id, text[start:end].lstrip('@')))
+        cursor = end
+
+    if not mentioned or not text[cursor:cursor + 1].isspace():
+        return text, []
+    return text[:prefix.end()] + MENTION_MARKER + text[cursor:], mentioned
+
+
+class ProfileCache:
+    """帶 TTL 的顯示名稱快取"""
+
+    def __init__(self, line_bot_api, ttl=PROFILE_CACHE_TTL, max_size=PROFILE_CACHE_SIZE):
+        self.line_bot_api = line_bot_api
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._names = {}
+        self._executor = ThreadPoolExecutor(max_workers=PROFILE_LOOKUP_WORKERS)
+
+    def _fetch(self, target_type, chat_id, user_id):
+        try:
+            if target_type == 'group':
+                profile = self.line_bot_api.get_group_member_profile(chat_id, user_id)
+            elif target_type == 'room':
+                profile = self.line_bot_api.get_room_member_profile(chat_id, user_id)
+            else:
+                profile = self.line_bot_api.get_profile(user_id)
+            return profile.display_name
+        except LineBotApiError as e:
+            logger.warning(f"Failed to get profile for {user_id}: {e}")
+            return None
+
+    def get_display_names(self, target_type, chat_id, user_ids):
+        """查詢多位成員的顯示名稱，回傳 {user_id: 名稱}；查不到的成員不會出現在結果中"""
+        now = time.monotonic()
+        names = {}
+        missing = []
+        with self._lock:
+            for user_id in dict.fromkeys(user_ids):
+                cached = self._names.get((chat_id, user_id))
+                if cached and cached[1] > now:
+                    names[user_id] = cached[0]
+                else:
+                    missing.append(user_id)
+
+        if not missing:
+            return names
+
+        fetched = list(self._executor.map(lambda user_id: self._fetch(target_type, chat_id, user_id), missing))
+        expires_at = now + self.ttl
+        with self._lock:
+            if len(self._names) + len(missing) > self.max_size:
+                self._evict(now)
+            for user_id, name in zip(missing, fetched):
+                if name:
+                    names[user_id] = name
+                    self._names[(chat_id, user_id)] = (name, expires_at)
+        return names
+
+    def get_display_name(self, target_type, chat_id, user_id):
+        return self.get_display_names(target_type, chat_id, [user_id]).get(user_id)
+
+    def _evict(self, now):
+        # 先清過期項目，仍然太多就丟掉最早加入的一半
+        self._names = {key: value for key, value in self._names.items() if value[1] > now}
+        if len(self._names) >= self.max_size:
+            keys = list(self._names)
+            for key in keys[:len(keys) // 2]:
+                del self._names[key]
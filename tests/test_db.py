@@ -0,0 +1,135 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+import db
+from db import InstrumentedQueuePool, is_transient_error, run_in_session, safe_db_operation, unit_of_work
+
+
+class PgError(Exception):
+    """模擬帶 pgcode 的 psycopg2 例外"""
+
+    def __init__(self, pgcode):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+
+@pytest.mark.parametrize("error, transient", [
+    (OperationalError("SELECT 1", {}, PgError('40001')), True),   # 序列化失敗
+    (OperationalError("SELECT 1", {}, PgError('40P01')), True),   # 死結
+    (OperationalError("SELECT 1", {}, PgError('57P01')), True),   # 管理員中斷連線
+    (OperationalError("SELECT 1", {}, Exception("server closed the connection")), True),
+    (OperationalError("SELECT 1", {}, PgError('57014'), connection_invalidated=True), True),
+    (IntegrityError("INSERT", {}, PgError('23505')), False),      # 違反唯一鍵
+    (OperationalError("SELECT 1", {}, PgError('57014')), False),  # statement_timeout
+    (PoolTimeoutError("QueuePool limit reached"), False),
+    (ValueError("bad input"), False),
+])
+def test_transient_error_classification(error, transient):
+    assert is_transient_error(error) is transient
+
+
+def _failing(errors):
+    calls = []
+
+    def operation():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return "ok"
+
+    return operation, calls
+
+
+def test_transient_errors_are_retried():
+    operation, calls = _failing([OperationalError("SELECT 1", {}, PgError('40001'))] * 2)
+    assert safe_db_operation(operation, base_delay=0) == "ok"
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize("error", [
+    IntegrityError("INSERT", {}, PgError('23505')),
+    PoolTimeoutError("QueuePool limit reached"),
+])
+def test_non_transient_errors_are_not_retried(error):
+    operation, calls = _failing([error])
+    with pytest.raises(type(error)):
+        safe_db_operation(operation, base_delay=0)
+    assert len(calls) == 1
+
+
+def test_retries_give_up_after_max_retries():
+    operation, calls = _failing([OperationalError("SELECT 1", {}, PgError('40001'))] * 5)
+    with pytest.raises(OperationalError):
+        safe_db_operation(operation, max_retries=3, base_delay=0)
+    assert len(calls) == 3
+
+
+def test_nested_unit_of_work_reuses_session():
+    with unit_of_work() as outer:
+        with unit_of_work() as inner:
+            assert inner is outer
+        assert db.current_session() is outer
+        assert run_in_session(lambda session: session) is outer
+    assert db.current_session() is None
+
+
+def test_readonly_operations_use_short_lived_session():
+    with unit_of_work() as outer:
+        seen = run_in_session(lambda session: session, readonly=True)
+        assert seen is not outer
+        # 唯讀 session 在操作結束時已關閉，不會佔住連線
+        assert not seen.in_transaction()
+
+
+def _pool(tmp_path, pool_size=1, max_overflow=0, pool_timeout=5, connect_delay=0.0):
+    def connect():
+        time.sleep(connect_delay)
+        return sqlite3.connect(str(tmp_path / "pool.db"), check_same_thread=False)
+
+    engine = create_engine(
+        "sqlite://", creator=connect, poolclass=InstrumentedQueuePool,
+        pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout
+    )
+    return engine.pool
+
+
+def test_stats_count_checkouts_and_overflow(tmp_path):
+    pool = _pool(tmp_path, pool_size=1, max_overflow=1, pool_timeout=0.1)
+    first, second = pool.connect(), pool.connect()
+    stats = pool.stats()
+    assert (stats["checked_out"], stats["overflow"], stats["peak_overflow"]) == (2, 1, 1)
+
+    with pytest.raises(PoolTimeoutError):
+        pool.connect()
+    first.close()
+    second.close()
+
+    stats = pool.stats()
+    assert (stats["checkouts"], stats["timeouts"], stats["checked_out"], stats["peak_overflow"]) == (2, 1, 0, 1)
+
+
+def test_stats_measure_queue_wait(tmp_path):
+    pool = _pool(tmp_path, pool_size=1)
+    held = pool.connect()
+    threading.Timer(0.1, held.close).start()
+    pool.connect().close()
+
+    stats = pool.stats()
+    assert stats["checkouts"] == 2
+    assert stats["max_queue_wait_ms"] >= 80
+
+
+def test_queue_wait_excludes_connect_time(tmp_path):
+    pool = _pool(tmp_path, connect_delay=0.1)
+    pool.connect().close()
+
+    stats = pool.stats()
+    assert stats["connects"] == 1
+    assert stats["avg_connect_ms"] >= 100
+    assert stats["max_queue_wait_ms"] < 50
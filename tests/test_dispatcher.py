@@ -0,0 +1,250 @@
+import os
+import time
+import multiprocessing
+from datetime import datetime, timedelta
+
+import pytest
+
+# 需要可寫入的 PostgreSQL（會建立資料表並寫入測試事件），例如
+# TEST_DATABASE_URL=postgresql+psycopg2://postgres:@/postgres?host=/tmp/pgdata
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+if not TEST_DATABASE_URL:
+    pytest.skip("TEST_DATABASE_URL is not set", allow_module_level=True)
+
+import pytz
+from sqlalchemy import delete, select, update
+
+from db import Event, engine, init_db, run_in_session, shard_key_for
+from dispatcher import ShardWorker, claim_reminder, dispatch_batch, shard_of
+
+CREATOR = 'test-dispatcher'
+USERS = 40
+PER_USER = 10
+PUSH_LATENCY = 0.01
+
+fork = multiprocessing.get_context('fork')
+
+
+class StubLineBotApi:
+    """只記錄推播順序，每次推播模擬一段網路延遲"""
+
+    def __init__(self):
+        self.pushed = []
+
+    def push_message(self, to, message):
+        time.sleep(PUSH_LATENCY)
+        data = message.as_json_dict()['template']['actions'][0]['data']
+        self.pushed.append((to, int(data.rsplit('=', 1)[1])))
+
+
+class FlakyLineBotApi(StubLineBotApi):
+    """指定的 event 第一次推播時失敗"""
+
+    def __init__(self, fail_event_id):
+        super().__init__()
+        self.fail_event_id = fail_event_id
+
+    def push_message(self, to, message):
+        data = message.as_json_dict()['template']['actions'][0]['data']
+        if int(data.rsplit('=', 1)[1]) == self.fail_event_id:
+            self.fail_event_id = None
+            raise RuntimeError("push failed")
+        super().push_message(to, message)
+
+
+def _run_shard(shard_index, shard_count, results):
+    # fork 進來的連線池屬於父程序，子程序必須重建
+    engine.dispose(close=False)
+    api = StubLineBotApi()
+    worker = ShardWorker(api, shard_index=shard_index, shard_count=shard_count)
+    while worker.run_once():
+        pass
+    results.put((shard_index, api.pushed))
+
+
+def _delete_test_events():
+    run_in_session(lambda db: db.execute(delete(Event).where(Event.creator_user_id == CREATOR)))
+
+
+def _create_due_events():
+    """每位使用者 PER_USER 則到期提醒，回傳 {user_id: 依提醒時間排序的 event_id}"""
+    now = datetime.now(pytz.UTC)
+
+    def _create(db):
+        events = []
+        for sequence in range(PER_USER):
+            for user in range(USERS):
+                user_id = f"U{user:04d}"
+                events.append(Event(
+                    creator_user_id=CREATOR,
+                    target_user_id=user_id,
+                    target_display_name=user_id,
+                    event_content=f"event {sequence}",
+                    event_datetime=now,
+                    # 落在補送寬限內，同一使用者的提醒時間依 sequence 遞增
+                    reminder_time=now - timedelta(seconds=300) + timedelta(milliseconds=sequence * 10),
+                    shard_key=shard_key_for(user_id),
+                ))
+        db.add_all(events)
+        db.flush()
+        return _ids_by_user(events)
+
+    return run_in_session(_create)
+
+
+def _ids_by_user(events):
+    ordered = {}
+    for event in sorted(events, key=lambda e: (e.reminder_time, e.id)):
+        ordered.setdefault(event.target_user_id, []).append(event.id)
+    return ordered
+
+
+def _dispatch(shard_count, workers_per_shard=1):
+    results = fork.Queue()
+    processes = [
+        fork.Process(target=_run_shard, args=(index, shard_count, results))
+        for index in range(shard_count)
+        for _ in range(workers_per_shard)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    # [(shard 編號, 該程序依序推播的 (user_id, event_id))]
+    pushed = [results.get(timeout=120) for _ in processes]
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    return pushed, elapsed
+
+
+@pytest.fixture(scope='module', autouse=True)
+def database():
+    init_db()
+    _delete_test_events()
+    yield
+    _delete_test_events()
+
+
+@pytest.mark.parametrize("shard_count", [1, 4])
+def test_each_reminder_sent_once_in_order(shard_count):
+    expected = _create_due_events()
+    try:
+        pushed, elapsed = _dispatch(shard_count)
+    finally:
+        _delete_test_events()
+
+    sent = [event_id for _, shard in pushed for _, event_id in shard]
+    assert sorted(sent) == sorted(event_id for ids in expected.values() for event_id in ids)
+
+    by_user = {}
+    for shard_index, shard in pushed:
+        for user_id, event_id in shard:
+            assert shard_of(user_id, shard_count) == shard_index
+            by_user.setdefault(user_id, []).append(event_id)
+    assert by_user == expected
+
+    print(f"\n{shard_count} shard(s): {len(sent) / elapsed:.0f} reminders/sec ({len(sent)} in {elapsed:.2f}s)")
+
+
+def test_overlapping_workers_send_each_reminder_once():
+    # 重新分配期間可能有多個 worker 同時掃描同一個 shard，SKIP LOCKED 必須讓每則只被認領一次
+    expected = _create_due_events()
+    try:
+        pushed, _ = _dispatch(2, workers_per_shard=3)
+    finally:
+        _delete_test_events()
+
+    sent = [event_id for _, shard in pushed for _, event_id in shard]
+    assert len(sent) == len(set(sent))
+    assert sorted(sent) == sorted(event_id for ids in expected.values() for event_id in ids)
+
+
+def test_shards_scale_throughput():
+    elapsed = {}
+    for shard_count in (1, 4):
+        _create_due_events()
+        try:
+            _, elapsed[shard_count] = _dispatch(shard_count)
+        finally:
+            _delete_test_events()
+    speedup = elapsed[1] / elapsed[4]
+    print(f"\n4 shards vs 1: x{speedup:.2f}")
+    # 推播延遲佔大部分時間，4 個 shard 至少要明顯快於 1 個
+    assert speedup > 2
+
+
+def test_sent_reminders_are_not_claimed_again():
+    _create_due_events()
+    try:
+        _dispatch(2)
+        remaining = run_in_session(lambda db: db.scalars(
+            select(Event.id).where(Event.creator_user_id == CREATOR, Event.reminder_sent == 0)
+        ).all(), readonly=True)
+        assert remaining == []
+        pushed, _ = _dispatch(2)
+        assert all(shard == [] for _, shard in pushed)
+    finally:
+        _delete_test_events()
+
+
+def test_snooze_during_send_is_kept():
+    expected = _create_due_events()
+    event_id = expected['U0000'][0]
+    snoozed_until = datetime.now(pytz.UTC) + timedelta(minutes=5)
+    try:
+        claimed = claim_reminder(event_id)
+        # 推播途中使用者按下延後：與 app.snooze_event 相同，清掉租約並改寫提醒時間
+        run_in_session(lambda db: db.execute(
+            update(Event)
+            .where(Event.id == event_id)
+            .values(reminder_time=snoozed_until, reminder_sent=0, claimed_at=None)
+        ))
+        assert dispatch_batch(StubLineBotApi(), [claimed]) == 1
+
+        event = run_in_session(lambda db: db.get(Event, event_id), readonly=True)
+        assert (event.reminder_sent, event.reminder_time) == (0, snoozed_until)
+    finally:
+        _delete_test_events()
+
+
+def test_failed_push_keeps_user_order():
+    expected = _create_due_events()
+    failing = expected['U0000'][1]
+    api = FlakyLineBotApi(failing)
+    try:
+        worker = ShardWorker(api, shard_index=0, shard_count=1)
+        # 失敗的那則與同一使用者後面的提醒被釋放，下一次掃描依序重試
+        while worker.run_once():
+            pass
+        remaining = run_in_session(lambda db: db.scalars(
+            select(Event.id).where(Event.creator_user_id == CREATOR, Event.reminder_sent == 0)
+        ).all(), readonly=True)
+    finally:
+        _delete_test_events()
+
+    assert api.fail_event_id is None
+    assert remaining == []
+    by_user = {}
+    for user_id, event_id in api.pushed:
+        by_user.setdefault(user_id, []).append(event_id)
+    assert by_user == expected
+
+
+def test_stale_job_does_not_claim_rescheduled_reminder():
+    expected = _create_due_events()
+    event_id = expected['U0000'][0]
+    rescheduled = datetime.now(pytz.UTC) + timedelta(hours=1)
+    try:
+        # 使用者改了提醒時間：舊的排程任務觸發時不能提早送出
+        run_in_session(lambda db: db.execute(
+            update(Event).where(Event.id == event_id).values(reminder_time=rescheduled)
+        ))
+        assert claim_reminder(event_id) is None
+
+        run_in_session(lambda db: db.execute(
+            update(Event).where(Event.id == event_id).values(reminder_time=datetime.now(pytz.UTC))
+        ))
+        assert claim_reminder(event_id).id == event_id
+    finally:
+        _delete_test_events()
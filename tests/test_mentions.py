@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+import pytest
+
+from profiles import MENTION_MARKER, collapse_mentions
+
+
+def message(text, *mentions):
+    """組出帶 mention 的 TextMessage；index 與 LINE 一樣以 UTF-16 計算"""
+    mentionees = []
+    for name, user_id in mentions:
+        start = text.index(name)
+        mentionees.append(SimpleNamespace(
+            index=len(text[:start].encode('utf-16-le')) // 2,
+            length=len(name.encode('utf-16-le')) // 2,
+            user_id=user_id,
+        ))
+    return SimpleNamespace(text=text, mention=SimpleNamespace(mentionees=mentionees) if mentionees else None)
+
+
+def collapse(msg):
+    return collapse_mentions(msg, msg.text.strip())
+
+
+def test_leading_mention_only():
+    msg = message("提醒 @小明 明天9點 😀開會 @小華", ("@小明", "U2"), ("@小華", "U3"))
+    assert collapse(msg) == (f"提醒 {MENTION_MARKER} 明天9點 😀開會 @小華", [("U2", "小明")])
+
+
+def test_consecutive_leading_mentions():
+    msg = message("提醒 @小明 @小華 明天 9點 開會", ("@小明", "U2"), ("@小華", "U3"))
+    assert collapse(msg) == (f"提醒 {MENTION_MARKER} 明天 9點 開會", [("U2", "小明"), ("U3", "小華")])
+
+
+def test_emoji_display_names():
+    msg = message("提醒 @小明😀 明天 9點 開會", ("@小明😀", "U2"))
+    assert collapse(msg) == (f"提醒 {MENTION_MARKER} 明天 9點 開會", [("U2", "小明😀")])
+
+    msg = message("提醒 @小明😀 @🐱小華 明天 9點 開會 @小美", ("@小明😀", "U2"), ("@🐱小華", "U3"), ("@小美", "U4"))
+    assert collapse(msg) == (f"提醒 {MENTION_MARKER} 明天 9點 開會 @小美", [("U2", "小明😀"), ("U3", "🐱小華")])
+
+
+def test_run_stops_at_content():
+    msg = message("提醒 @小明 明天 9點 找 @小華 開會", ("@小明", "U2"), ("@小華", "U3"))
+    assert collapse(msg) == (f"提醒 {MENTION_MARKER} 明天 9點 找 @小華 開會", [("U2", "小明")])
+
+
+def test_leading_whitespace_in_raw_text():
+    msg = message("  提醒 @小明 明天 9點 開會", ("@小明", "U2"))
+    assert collapse(msg) == (f"提醒 {MENTION_MARKER} 明天 9點 開會", [("U2", "小明")])
+
+
+@pytest.mark.parametrize("msg", [
+    # 提醒對象不是提及，內容中的提及保留原樣
+    message("提醒 我 明天 9點 找 @小華 開會", ("@小華", "U3")),
+    # 提及後面直接接文字，不是完整的提醒對象
+    message("提醒 @小明明天 9點 開會", ("@小明", "U2")),
+    # 不是提醒指令
+    message("@小明 提醒 明天 9點 開會", ("@小明", "U2")),
+    # 沒有提及
+    message("提醒 我 明天 9點 開會"),
+])
+def test_unchanged_without_leading_mention(msg):
+    assert collapse(msg) == (msg.text.strip(), [])
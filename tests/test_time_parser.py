@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from time_parser import TAIPEI_TZ, _reference_dates, cn_to_int, parse_time_expression
+
+# 2025/07/14 是星期一
+NOW = TAIPEI_TZ.localize(datetime(2025, 7, 14, 10, 0))
+
+
+def at(month, day, hour, minute=0):
+    return TAIPEI_TZ.localize(datetime(2025, month, day, hour, minute))
+
+
+def parse(text):
+    return parse_time_expression(text, NOW)
+
+
+@pytest.mark.parametrize("text, expected, rest", [
+    # N分鐘/小時/天/週後
+    ("3小時後 喝水", at(7, 14, 13), " 喝水"),
+    ("3個小時後 喝水", at(7, 14, 13), " 喝水"),
+    ("10分鐘後 出門", at(7, 14, 10, 10), " 出門"),
+    ("十分鐘後 出門", at(7, 14, 10, 10), " 出門"),
+    ("半小時後 關火", at(7, 14, 10, 30), " 關火"),
+    ("2天後 繳費", at(7, 16, 10), " 繳費"),
+    ("兩天以後 繳費", at(7, 16, 10), " 繳費"),
+    ("1週後 回診", at(7, 21, 10), " 回診"),
+    ("一個星期後 回診", at(7, 21, 10), " 回診"),
+    # 今天/明天/後天 與 今晚/明早
+    ("明天 17:20 繳費", at(7, 15, 17, 20), " 繳費"),
+    ("明天下午3點半 牙醫", at(7, 15, 15, 30), " 牙醫"),
+    ("後天 上午10點 面試", at(7, 16, 10), " 面試"),
+    ("大後天 9點 出差", at(7, 17, 9), " 出差"),
+    ("明天 做某事", at(7, 15, 10), "做某事"),
+    ("今晚八點 看書", at(7, 14, 20), " 看書"),
+    ("明早七點十五分 跑步", at(7, 15, 7, 15), " 跑步"),
+    ("明晚9點 聚餐", at(7, 15, 21), " 聚餐"),
+    # 中午 / 晚上12點 / 凌晨12點
+    ("明天中午12點 午餐", at(7, 15, 12), " 午餐"),
+    ("明天中午1點 午餐", at(7, 15, 13), " 午餐"),
+    ("明天晚上12點 睡覺", at(7, 16, 0), " 睡覺"),
+    ("今晚12點 睡覺", at(7, 15, 0), " 睡覺"),
+    ("明天凌晨12點 收衣服", at(7, 15, 0), " 收衣服"),
+    # 星期：未加前綴時取最近的下一個，已過則順延一週
+    ("週一 9點 開會", at(7, 21, 9), " 開會"),
+    ("週一 11點 開會", at(7, 14, 11), " 開會"),
+    ("週日 9點 爬山", at(7, 20, 9), " 爬山"),
+    ("星期五晚上7點 聚餐", at(7, 18, 19), " 聚餐"),
+    ("禮拜天 打球", at(7, 20, 10), "打球"),
+    ("下週一 9點 開會", at(7, 21, 9), " 開會"),
+    ("下週日 打球", at(7, 27, 10), "打球"),
+    ("這週三 14:00 報告", at(7, 16, 14), " 報告"),
+    ("本週一 9點 開會", at(7, 14, 9), " 開會"),
+    ("下下週二 8點 複診", at(7, 29, 8), " 複診"),
+    # 只有鐘點：已過則順延到明天
+    ("9點 起床", at(7, 15, 9), " 起床"),
+    ("11點 開會", at(7, 14, 11), " 開會"),
+    ("晚上8點 倒垃圾", at(7, 14, 20), " 倒垃圾"),
+    ("8點30分 晨會", at(7, 15, 8, 30), " 晨會"),
+    ("10：30 開會", at(7, 14, 10, 30), " 開會"),
+    # 沒有「分」的阿拉伯數字分鐘只在後面接空白或結尾時才算，中文數字分鐘不受限制
+    ("下午3點5 開會", at(7, 14, 15, 5), " 開會"),
+    ("下午3點5", at(7, 14, 15, 5), ""),
+    ("下午3點5樓開會", at(7, 14, 15), "5樓開會"),
+    ("八點十五開會", at(7, 15, 8, 15), "開會"),
+    ("十一點二十 開會", at(7, 14, 11, 20), " 開會"),
+    # 點鐘
+    ("下午3點鐘 開會", at(7, 14, 15), " 開會"),
+    ("明天八點鐘開會", at(7, 15, 8), "開會"),
+])
+def test_resolves_expression(text, expected, rest):
+    assert parse(text) == (expected, rest)
+
+
+@pytest.mark.parametrize("text", [
+    "24點 開會",
+    "明天 25:00 開會",
+    "9點61分 開會",
+    "0分鐘後 出門",
+    "3個月後 續約",
+    "半天後 出門",
+    "今晚 看書",
+    "做某事",
+    "2025/07/15 17:20 做某事",
+    "7/15 17:20 做某事",
+])
+def test_rejects_expression(text):
+    assert parse(text) is None
+
+
+def _to_chinese(value):
+    digits = "零一二三四五六七八九"
+    if value < 10:
+        return digits[value]
+    tens, ones = divmod(value, 10)
+    return ("" if tens == 1 else digits[tens]) + "十" + (digits[ones] if ones else "")
+
+
+@pytest.mark.parametrize("value", range(0, 100))
+def test_cn_to_int(value):
+    assert cn_to_int(_to_chinese(value)) == value
+    assert cn_to_int(str(value)) == value
+
+
+@pytest.mark.parametrize("unit, kwarg", [("分鐘", "minutes"), ("小時", "hours"), ("天", "days")])
+@pytest.mark.parametrize("value", range(1, 100))
+def test_relative_offsets(unit, kwarg, value):
+    expected = TAIPEI_TZ.normalize(NOW + timedelta(**{kwarg: value}))
+    assert parse(f"{value}{unit}後 做事") == (expected, " 做事")
+    assert parse(f"{_to_chinese(value)}{unit}後 做事") == (expected, " 做事")
+
+
+def test_reference_dates_are_memoized_per_minute():
+    _reference_dates.cache_clear()
+    parse("明天 9點 開會")
+    parse_time_expression("明天 9點 開會", NOW.replace(second=30))
+    info = _reference_dates.cache_info()
+    assert (info.misses, info.hits) == (1, 1)
@@ -0,0 +1,221 @@
+# time_parser.py
+# 中文相對時間解析：今晚八點、下週一 9點、3小時後、明天下午3點半 ...
+
+import re
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+import pytz
+
+TAIPEI_TZ = pytz.timezone('Asia/Taipei')
+
+# ---------------------------------
+# 詞彙表
+# ---------------------------------
+CN_DIGITS = {
+    '零': 0, '〇': 0, '一': 1, '二': 2, '兩': 2, '两': 2, '三': 3,
+    '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9,
+}
+
+DAY_OFFSETS = {
+    '今天': 0, '今日': 0,
+    '明天': 1, '明日': 1,
+    '後天': 2, '后天': 2,
+    '大後天': 3, '大后天': 3,
+}
+
+# 今晚 / 明早 這類同時帶有日期與時段的詞
+DAY_PERIOD_WORDS = {
+    '今早': (0, '早上'), '今晚': (0, '晚上'),
+    '明早': (1, '早上'), '明晚': (1, '晚上'),
+}
+
+WEEKDAYS = {'一': 0, '二': 1, '三': 2, '四': 3, '五': 4, '六': 5, '日': 6, '天': 6}
+
+# 週次前綴 -> 相對本週起始日的週數，None 表示「最近的下一個」
+WEEK_PREFIXES = {'': None, '這': 0, '这': 0, '本': 0, '下': 1, '下下': 2}
+
+PERIODS = ('凌晨', '半夜', '早上', '上午', '中午', '下午', '傍晚', '晚上')
+PM_PERIODS = ('下午', '傍晚', '晚上')
+
+RELATIVE_UNITS = {
+    '分鐘': 'minutes', '分钟': 'minutes', '分': 'minutes',
+    '小時': 'hours', '小时': 'hours', '鐘頭': 'hours', '钟头': 'hours',
+    '天': 'days', '日': 'days',
+    '週': 'weeks', '周': 'weeks', '星期': 'weeks', '禮拜': 'weeks', '礼拜': 'weeks',
+}
+
+
+def _alternation(words):
+    # 較長的詞優先，避免「後天」搶先匹配「大後天」的一部分
+    return '|'.join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+_NUM = r'(?:\d{1,2}|[零〇一二兩两三四五六七八九十]{1,3})'
+
+RELATIVE_PATTERN = re.compile(
+    rf'^\s*(?P<n>\d+|[零〇一二兩两三四五六七八九十]{{1,3}}|半)\s*個?\s*'
+    rf'(?P<unit>{_alternation(RELATIVE_UNITS)})\s*(?:之後|以後|之后|以后|後|后)'
+)
+
+ABSOLUTE_PATTERN = re.compile(
+    r'^\s*(?:'
+    rf'(?P<day>{_alternation(DAY_OFFSETS)})'
+    rf'|(?P<day_period>{_alternation(DAY_PERIOD_WORDS)})'
+    rf'|(?P<week>下下|下|這|这|本)?\s*(?:週|周|星期|禮拜|礼拜)(?P<weekday>[{"".join(WEEKDAYS)}])'
+    r')?'
+    rf'\s*(?P<period>{_alternation(PERIODS)})?'
+    r'\s*(?:'
+    # 沒有「分」的阿拉伯數字分鐘必須接空白或結尾，避免「3點5樓」把內容裡的數字當成分鐘；
+    # 中文數字分鐘（八點十五）不受限制
+    rf'(?P<hour>{_NUM})\s*(?:點|点|時|时)(?:鐘|钟)?'
+    r'(?:(?P<half>半)|(?P<minute>\d{1,2}(?=分|\s|$)|[零〇一二兩两三四五六七八九十]{1,3})分?)?'
+    r'|(?P<hh>\d{1,2})\s*[:：]\s*(?P<mm>\d{2})'
+    r')?'
+)
+
+
+def cn_to_int(text):
+    """將阿拉伯數字或 0-99 的中文數字轉為整數，無法解析時回傳 None"""
+    if text.isdigit():
+        return int(text)
+    try:
+        if '十' in text:
+            tens, _, ones = text.partition('十')
+            return (CN_DIGITS[tens] if tens else 1) * 10 + (CN_DIGITS[ones] if ones else 0)
+        value = 0
+        for ch in text:
+            value = value * 10 + CN_DIGITS[ch]
+        return value
+    except KeyError:
+        return None
+
+
+@lru_cache(maxsize=8)
+def _reference_dates(minute_key):
+    """以分鐘為單位快取今天與本週一的日期"""
+    today = minute_key.date()
+    week_start = today - timedelta(days=today.weekday())
+    return today, week_start
+
+
+def _localize(day, hour, minute):
+    return TAIPEI_TZ.localize(datetime(day.year, day.month, day.day, hour, minute))
+
+
+def parse_time_expression(text, now=None):
+    """解析字串開頭的中文時間描述
+
+    回傳 (台北時區的 datetime, 剩餘字串)；開頭不是可辨識的時間描述時回傳 None。
+    """
+    if now is None:
+        now = datetime.now(TAIPEI_TZ)
+    else:
+        now = now.astimezone(TAIPEI_TZ)
+
+    # N分鐘/小時/天後
+    match = RELATIVE_PATTERN.match(text)
+    if match:
+        n = match.group('n')
+        unit = RELATIVE_UNITS[match.group('unit')]
+        if n == '半':
+            if unit != 'hours':
+                return None
+            delta = timedelta(minutes=30)
+        else:
+            value = cn_to_int(n)
+            if not value:
+                return None
+            delta = timedelta(**{unit: value})
+        return TAIPEI_TZ.normalize(now + delta), text[match.end():]
+
+    match = ABSOLUTE_PATTERN.match(text)
+    if not match:
+        return None
+    groups = match.groupdict()
+    has_clock = groups['hour'] is not None or groups['hh'] is not None
+    has_day = groups['day'] or groups['day_period'] or groups['weekday']
+    if not has_clock and not has_day:
+        return None
+
+    today, week_start = _reference_dates(now.replace(second=0, microsecond=0))
+    period = groups['period']
+    roll = None  # 時間已過時往後順延的天數
+
+    if groups['day']:
+        day = today + timedelta(days=DAY_OFFSETS[groups['day']])
+    elif groups['day_period']:
+        offset, default_period = DAY_PERIOD_WORDS[groups['day_period']]
+        day = today + timedelta(days=offset)
+        period = period or default_period
+    elif groups['weekday']:
+        weeks = WEEK_PREFIXES[groups['week'] or '']
+        weekday = WEEKDAYS[groups['weekday']]
+        if weeks is None:
+            day = week_start + timedelta(days=weekday)
+            if day < today:
+                day += timedelta(days=7)
+            roll = 7
+        else:
+            day = week_start + timedelta(days=weeks * 7 + weekday)
+    else:
+        day = today
+        roll = 1
+
+    if not has_clock:
+        # 只有時段沒有鐘點（例如「今晚」）無法決定時間
+        if period:
+            return None
+        hour, minute = now.hour, now.minute
+    elif groups['hh'] is not None:
+        hour, minute = int(groups['hh']), int(groups['mm'])
+    else:
+        hour = cn_to_int(groups['hour'])
+        if groups['half']:
+            minute = 30
+        elif groups['minute']:
+            minute = cn_to_int(groups['minute'])
+        else:
+            minute = 0
+        if hour is None or minute is None:
+            return None
+
+    if period in PM_PERIODS and hour < 12:
+        hour += 12
+    elif period == '中午' and hour < 11:
+        hour += 12
+    elif period in ('凌晨', '半夜', '晚上') and hour == 12:
+        hour = 0
+        if period == '晚上':
+            day += timedelta(days=1)
+
+    if hour > 23 or minute > 59:
+        return None
+
+    result = _localize(day, hour, minute)
+    if roll and result <= now:
+        result = _localize(day + timedelta(days=roll), hour, minute)
+    return result, text[match.end():]
+
+
+# ---------------------------------
+# 效能測試：python time_parser.py
+# ---------------------------------
+if __name__ == "__main__":
+    samples = [
+        '下週一 9點 開會', '3小時後 喝水', '今晚八點 看書', '明天下午3點半 牙醫',
+        '後天 17:20 繳費', '週五晚上7點 聚餐', '半小時後 關火', '10分鐘後 出門',
+        '明早七點十五分 跑步', '星期日中午12點 午餐', '這週三 14:00 報告', '大後天 上午10點 面試',
+    ]
+    reference = TAIPEI_TZ.localize(datetime(2025, 7, 14, 10, 0))
+    iterations = 20000
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for sample in samples:
+            parse_time_expression(sample, reference)
+    elapsed = time.perf_counter() - start
+    total = iterations * len(samples)
+    for sample in samples:
+        dt, rest = parse_time_expression(sample, reference)
+        print(f"{sample!r:28} -> {dt.strftime('%Y/%m/%d %H:%M')} {rest.strip()}")
+    print(f"{total} parses in {elapsed:.3f}s ({total / elapsed:,.0f} parses/sec)")